@@ -1,5 +1,6 @@
 # coding: utf-8
-from typing import Tuple, Union
+from collections import OrderedDict, deque
+from typing import List, Tuple, Union
 
 import numpy as np
 
@@ -11,7 +12,8 @@ from .policy_value_net import PolicyValueNet
 class AlphaZeroMCTS:
     """ 基于策略-价值网络的蒙特卡洛搜索树 """
 
-    def __init__(self, policy_value_net: PolicyValueNet, c_puct: float = 4, n_iters=1200, is_self_play=False) -> None:
+    def __init__(self, policy_value_net: PolicyValueNet, c_puct: float = 4, n_iters=1200, is_self_play=False,
+                 batch_size=8, virtual_loss=3, cache_size=20000) -> None:
         """
         Parameters
         ----------
@@ -26,12 +28,28 @@ class AlphaZeroMCTS:
 
         is_self_play: bool
             是否处于自我博弈状态
+
+        batch_size: int
+            每次送入策略价值网络的叶节点个数
+
+        virtual_loss: float
+            搜索到待评估的叶节点时施加在路径上的虚拟损失
+
+        cache_size: int
+            置换表的容量，置换表以包含双方最近落点的 Zobrist 哈希值 `ChessBoard.history_hash` 为键缓存策略价值网络的输出，
+            落子顺序不同的相同局面的历史特征平面不同，所以不会共用网络输出
         """
         self.c_puct = c_puct
         self.n_iters = n_iters
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.cache_size = cache_size
+        self.__cache = OrderedDict()
         self.is_self_play = is_self_play
         self.policy_value_net = policy_value_net
         self.root = Node(prior_prob=1, parent=None)
+        # 根节点对应的棋盘局面
+        self.__root_board = None  # type:ChessBoard
 
     def get_action(self, chess_board: ChessBoard) -> Union[Tuple[int, np.ndarray], int]:
         """ 根据当前局面返回下一步动作
@@ -49,32 +67,24 @@ class AlphaZeroMCTS:
         pi: `np.ndarray` of shape `(board_len^2, )`
             执行动作空间中每个动作的概率，只在 `is_self_play=True` 模式下返回
         """
-        for i in range(self.n_iters):
-            # 拷贝棋盘
-            board = chess_board.copy()
+        self.__sync_root(chess_board)
 
-            # 如果没有遇到叶节点，就一直向下搜索并更新棋盘
-            node = self.root
-            while not node.is_leaf_node():
-                action, node = node.select()
-                board.do_action(action)
+        # 异步前馈时最多同时评估两批叶节点，使 CPU 选择下一批叶节点时 GPU 可以前馈上一批叶节点，
+        # 同步前馈时没有可以重叠的计算，评估完就立即拓展，避免在没有拓展的树上选择下一批叶节点
+        n_pending = 2 if self.policy_value_net.is_async else 1
+        i, pending = 0, deque()
+        while i < self.n_iters or pending:
+            nodes = []
+            if i < self.n_iters:
+                nodes, boards, n = self.__select_leaves(
+                    chess_board, self.n_iters - i, pending)
+                i += n
+                if nodes:
+                    pending.append(
+                        (nodes, boards, self.__evaluate_async(boards)))
 
-            # 判断游戏是否结束，如果没结束就拓展叶节点
-            is_over, winner = board.is_game_over()
-            p, value = self.policy_value_net.predict(board)
-            if not is_over:
-                # 添加狄利克雷噪声
-                if self.is_self_play:
-                    p = 0.75*p + 0.25 * \
-                        np.random.dirichlet(0.03*np.ones(len(p)))
-                node.expand(zip(board.available_actions, p))
-            elif winner is not None:
-                value = 1 if winner == board.current_player else -1
-            else:
-                value = 0
-
-            # 反向传播
-            node.backup(-value)
+            if pending and (len(pending) >= n_pending or not nodes or i >= self.n_iters):
+                self.__expand_nodes(*pending.popleft())
 
         # 计算 π，在自我博弈状态下：游戏的前三十步，温度系数为 1，后面的温度系数趋于无穷小
         T = 1 if self.is_self_play and len(chess_board.state) <= 30 else 1e-3
@@ -85,18 +95,150 @@ class AlphaZeroMCTS:
         actions = list(self.root.children.keys())
         action = int(np.random.choice(actions, p=pi_))
 
+        # 更新根节点，保留子树供下一步搜索使用
+        self.advance_root(action)
+
         if self.is_self_play:
             # 创建维度为 board_len^2 的 π
             pi = np.zeros(chess_board.board_len**2)
             pi[actions] = pi_
-            # 更新根节点
-            self.root = self.root.children[action]
-            self.root.parent = None
             return action, pi
         else:
-            self.reset_root()
             return action
 
+    def advance_root(self, action: int):
+        """ 将动作对应的子节点作为新的根节点，保留子树中的访问次数和网络估值
+
+        `get_action` 会自动更新根节点，与其他玩家对弈时，需要在对手落子之后调用此函数
+
+        Parameters
+        ----------
+        action: int
+            根节点局面下执行的动作
+        """
+        child = self.root.children.get(action)
+        if child is None:
+            child = Node(prior_prob=1, c_puct=self.c_puct, parent=None)
+
+        # 断开和父节点的连接，其他子树会被回收
+        self.root = child
+        self.root.parent = None
+
+        if self.__root_board is not None:
+            self.__root_board.do_action(action)
+
+    def __sync_root(self, chess_board: ChessBoard):
+        """ 检查根节点是否对应当前局面，如果对手落子后没有更新根节点就自动更新，对应不上则重置根节点 """
+        root_board = self.__root_board
+        if root_board is not None and root_board.hash != chess_board.hash:
+            action = chess_board.previous_action
+            if action is not None and root_board.available_mask >> action & 1:
+                self.advance_root(action)
+
+            if root_board.hash != chess_board.hash:
+                self.root = Node(prior_prob=1, c_puct=self.c_puct, parent=None)
+                root_board = None
+
+        if root_board is None:
+            self.__root_board = chess_board.copy()
+
+    def __select_leaves(self, chess_board: ChessBoard, n_iters: int, pending: deque):
+        """ 收集一批叶节点，施加虚拟损失使每次搜索尽量走向不同的叶节点
+
+        Parameters
+        ----------
+        chess_board: ChessBoard
+            根节点对应的棋盘
+
+        n_iters: int
+            剩余的搜索次数
+
+        pending: deque
+            正在等待评估的批次
+
+        Returns
+        -------
+        nodes: List[Node]
+            需要评估的叶节点
+
+        boards: List[ChessBoard]
+            叶节点对应的棋盘
+
+        n: int
+            完成的搜索次数，包括遇到游戏结束的搜索
+        """
+        nodes, boards, n = [], [], 0
+        while len(nodes) < self.batch_size and n < n_iters:
+            # 拷贝棋盘
+            board = chess_board.copy()
+
+            # 如果没有遇到叶节点，就一直向下搜索并更新棋盘
+            node = self.root
+            while not node.is_leaf_node():
+                action, node = node.select()
+                board.do_action(action)
+
+            # 如果游戏结束就直接反向传播
+            is_over, winner = board.is_game_over()
+            if is_over:
+                if winner is not None:
+                    value = 1 if winner == board.current_player else -1
+                else:
+                    value = 0
+                node.backup(-value)
+                n += 1
+                continue
+
+            # 叶节点已经在等待评估，先评估已经收集的叶节点
+            if node in nodes or any(node in batch[0] for batch in pending):
+                break
+
+            node.add_virtual_loss(self.virtual_loss)
+            nodes.append(node)
+            boards.append(board)
+            n += 1
+
+        return nodes, boards, n
+
+    def __evaluate_async(self, boards: List[ChessBoard]):
+        """ 查询置换表并异步评估置换表中没有的局面，返回一个等待评估完成并返回 `(probs, value)` 列表的函数 """
+        keys = [board.history_hash for board in boards]
+        results = [self.__cache.get(key) for key in keys]
+
+        # 只评估置换表中没有的局面
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            wait = self.policy_value_net.predict_batch_async(
+                [boards[i] for i in missing])
+
+        def get_results():
+            if missing:
+                for i, result in zip(missing, wait()):
+                    results[i] = result
+
+            # 淘汰最久没有使用的局面，等待期间命中的局面可能已经被淘汰，所以重新插入
+            for key, result in zip(keys, results):
+                self.__cache[key] = result
+                self.__cache.move_to_end(key)
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+
+            return results
+
+        return get_results
+
+    def __expand_nodes(self, nodes: List[Node], boards: List[ChessBoard], get_results):
+        """ 等待叶节点评估完成，拓展叶节点并反向传播 """
+        for node, board, (p, value) in zip(nodes, boards, get_results()):
+            node.add_virtual_loss(-self.virtual_loss)
+
+            # 添加狄利克雷噪声
+            if self.is_self_play:
+                p = 0.75*p + 0.25*np.random.dirichlet(0.03*np.ones(len(p)))
+
+            node.expand(zip(board.available_actions, p))
+            node.backup(-value)
+
     def __getPi(self, visits, T) -> np.ndarray:
         """ 根据节点的访问次数计算 π """
         # pi = visits**(1/T) / np.sum(visits**(1/T)) 会出现标量溢出问题，所以使用对数压缩
@@ -106,8 +248,10 @@ class AlphaZeroMCTS:
         return pi
 
     def reset_root(self):
-        """ 重置根节点 """
+        """ 重置根节点并清空置换表 """
         self.root = Node(prior_prob=1, c_puct=self.c_puct, parent=None)
+        self.__root_board = None
+        self.__cache.clear()
 
     def set_self_play(self, is_self_play: bool):
         """ 设置蒙特卡洛树的自我博弈状态 """
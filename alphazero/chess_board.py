@@ -1,11 +1,17 @@
 # coding: utf-8
-from typing import Tuple
-from copy import deepcopy
-from collections import OrderedDict
+from collections import deque
+from typing import List, Tuple
 
 import torch
 import numpy as np
 
+from .chess_board_jit import build_planes, check_five
+
+try:
+    from ._chess_board_cpp import ChessBoard as _CppChessBoard
+except ImportError:
+    _CppChessBoard = None
+
 
 class ChessBoard:
     """ 棋盘类 """
@@ -14,6 +20,13 @@ class ChessBoard:
     WHITE = 0
     BLACK = 1
 
+    # 不同尺寸棋盘的 Zobrist 随机数表
+    _zobrist_tables = {}
+    # 不同尺寸棋盘的最近落点 Zobrist 随机数表
+    _history_zobrist_tables = {}
+    # 不同特征平面个数对应的历史特征平面位掩码
+    _plane_masks = {}
+
     def __init__(self, board_len=9, n_feature_planes=7):
         """
         Parameters
@@ -22,27 +35,100 @@ class ChessBoard:
             棋盘边长
 
         n_feature_planes: int
-            特征平面的个数，必须为偶数
+            特征平面的个数，必须为偶数，特征平面按位压缩在一个字节中，所以不能超过 8
         """
+        if n_feature_planes > 8:
+            raise ValueError('特征平面的个数不能超过 8')
+
         self.board_len = board_len
         self.current_player = self.BLACK
         self.n_feature_planes = n_feature_planes
-        self.available_actions = list(range(self.board_len**2))
+        # 落点个数和空棋盘的位掩码，落子时不会改变
+        self._n = board_len*board_len
+        self._full_mask = (1 << self._n) - 1
+        # 可用落点的位掩码，第 i 位为 1 代表 action=i 处可以落子
+        self.available_mask = self._full_mask
+        self._available_actions = None
         # 棋盘状态字典，key 为 action，value 为 current_player
-        self.state = OrderedDict()
+        self.state = {}
+        # 棋盘数组，供 jit 函数使用
+        self._board = np.full(self._n, self.EMPTY, dtype=np.int8)
+        # 每个玩家最近的落点，最新的在最前面，只保留构造历史特征平面需要的步数
+        n_history = (n_feature_planes - 1)//2
+        self._last_moves = (deque(maxlen=n_history), deque(maxlen=n_history))
+        # 传给 jit 函数的定长最近落点缓冲区，不足 n_history 步时用 -1 填充
+        self._moves_pad = (-1,)*n_history
+        self._moves_buf = np.full(2*n_history, -1, dtype=np.int16)
+        self._plane_luts, self._plane_keep_masks = self._get_plane_masks(
+            n_feature_planes)
         # 上一个落点
         self.previous_action = None
+        # 赢家，在落子时增量更新
+        self._winner = None
+        # 按位压缩的特征平面缓冲区，numpy 数组和张量共享内存
+        self._plane_buf = torch.zeros(self._n, dtype=torch.uint8)
+        self._plane_buf_np = self._plane_buf.numpy()
+        # 局面的 Zobrist 哈希值，在落子时增量更新
+        self.hash = 0
+        self._zobrist = self._get_zobrist_table(board_len)
+        # 倒数第 n_history 步以前的棋子出现在所有历史特征平面上，所以特征平面只和最近 n_history-1 步有关
+        self._n_hash_history = max(n_history - 1, 0)
+        self._history_zobrist = self._get_history_zobrist_table(board_len)
 
     def copy(self):
         """ 复制棋盘 """
-        return deepcopy(self)
+        board = PyChessBoard.__new__(PyChessBoard)
+        board.board_len = self.board_len
+        board.current_player = self.current_player
+        board.n_feature_planes = self.n_feature_planes
+        board._n = self._n
+        board._full_mask = self._full_mask
+        board.available_mask = self.available_mask
+        # 可用落点列表在落子后会重新生成，不会被原地修改，所以可以共享
+        board._available_actions = self._available_actions
+        board.state = dict(self.state)
+        board._board = self._board.copy()
+        board._last_moves = (self._last_moves[0].copy(), self._last_moves[1].copy())
+        board._plane_luts = self._plane_luts
+        board._plane_keep_masks = self._plane_keep_masks
+        board.previous_action = self.previous_action
+        board._winner = self._winner
+        # 特征平面在使用时会被立即拷贝，所以可以共享缓冲区
+        board._plane_buf = self._plane_buf
+        board._plane_buf_np = self._plane_buf_np
+        board._moves_pad = self._moves_pad
+        board._moves_buf = self._moves_buf
+        board.hash = self.hash
+        board._zobrist = self._zobrist
+        board._n_hash_history = self._n_hash_history
+        board._history_zobrist = self._history_zobrist
+        return board
+
+    def __copy__(self):
+        return self.copy()
 
     def clear_board(self):
         """ 清空棋盘 """
         self.state.clear()
+        self._board.fill(self.EMPTY)
+        self._last_moves[0].clear()
+        self._last_moves[1].clear()
         self.previous_action = None
+        self._winner = None
+        self.hash = 0
         self.current_player = self.BLACK
-        self.available_actions = list(range(self.board_len**2))
+        self.available_mask = self._full_mask
+        self._available_actions = None
+
+    @property
+    def available_actions(self) -> List[int]:
+        """ 可用落点列表，只在需要时根据位掩码生成 """
+        if self._available_actions is None:
+            mask = self.available_mask
+            self._available_actions = [
+                i for i in range(self._n) if mask >> i & 1]
+
+        return self._available_actions
 
     def do_action(self, action: int):
         """ 落子并更新棋盘
@@ -50,11 +136,25 @@ class ChessBoard:
         Parameters
         ----------
         action: int
-            落子位置，范围为 `[0, board_len^2 -1]`
+            落子位置，范围为 `[0, board_len^2 -1]`，位置上已经有棋子时抛出 `ValueError`
         """
+        # 位运算不支持 numpy 整数，先转换为 Python 整数
+        action = int(action)
+        if not self.available_mask >> action & 1:
+            raise ValueError(f'不能在位置 {action} 落子')
+
         self.previous_action = action
-        self.available_actions.remove(action)
+        self.available_mask &= ~(1 << action)
+        self._available_actions = None
+        self._last_moves[self.current_player].appendleft(action)
+        self._board[action] = self.current_player
         self.state[action] = self.current_player
+        self.hash ^= self._zobrist[action][self.current_player]
+
+        # 如果下的棋子不到 9 个，就不可能分出胜负
+        if len(self.state) >= 9:
+            self._winner = self._check_win_at(action, self.current_player)
+
         self.current_player = self.WHITE + self.BLACK - self.current_player
 
     def do_action_(self, pos: tuple) -> bool:
@@ -71,7 +171,7 @@ class ChessBoard:
             是否成功落子
         """
         action = pos[0]*self.board_len + pos[1]
-        if action in self.available_actions:
+        if 0 <= action < self._n and self.available_mask >> action & 1:
             self.do_action(action)
             return True
         return False
@@ -89,69 +189,171 @@ class ChessBoard:
             * 如果游戏分出胜负，则为 `ChessBoard.BLACK` 或 `ChessBoard.WHITE`
             * 如果还有分出胜负或者平局，则为 `None`
         """
-        # 如果下的棋子不到 9 个，就直接判断游戏还没结束
-        if len(self.state) < 9:
-            return False, None
-
-        n = self.board_len
-        act = self.previous_action
-        player = self.state[act]
-        row, col = act//n, act % n
-
-        # 搜索方向
-        directions = [[(0, -1),  (0, 1)],   # 水平搜索
-                      [(-1, 0),  (1, 0)],   # 竖直搜索
-                      [(-1, -1), (1, 1)],   # 主对角线搜索
-                      [(1, -1),  (-1, 1)]]  # 副对角线搜索
-
-        for i in range(4):
-            count = 1
-            for j in range(2):
-                flag = True
-                row_t, col_t = row, col
-                while flag:
-                    row_t = row_t + directions[i][j][0]
-                    col_t = col_t + directions[i][j][1]
-                    if 0 <= row_t < n and 0 <= col_t < n and self.state.get(row_t*n+col_t, self.EMPTY) == player:
-                        # 遇到相同颜色时 count+1
-                        count += 1
-                    else:
-                        flag = False
-            # 分出胜负
-            if count >= 5:
-                return True, player
+        # 分出胜负
+        if self._winner is not None:
+            return True, self._winner
 
         # 平局
-        if not self.available_actions:
+        if not self.available_mask:
             return True, None
 
         return False, None
 
+    def _check_win_at(self, action: int, player: int):
+        """ 判断 `player` 在 `action` 处落子后是否连成五子
+
+        Parameters
+        ----------
+        action: int
+            落子位置
+
+        player: int
+            落子玩家
+
+        Returns
+        -------
+        winner: int
+            如果连成五子则为 `player`，否则为 `None`
+        """
+        if check_five(self._board, action, player, self.board_len):
+            return player
+
+        return None
+
+    @classmethod
+    def _get_zobrist_table(cls, board_len: int):
+        """ 获取 Zobrist 随机数表，`table[action][player]` 为 `player` 落子在 `action` 处对应的随机数 """
+        if board_len not in cls._zobrist_tables:
+            table = np.random.SeedSequence(0).generate_state(
+                board_len**2*2, dtype=np.uint64).reshape(board_len**2, 2)
+            cls._zobrist_tables[board_len] = table.tolist()
+
+        return cls._zobrist_tables[board_len]
+
+    @classmethod
+    def _get_history_zobrist_table(cls, board_len: int):
+        """ 获取最近落点的 Zobrist 随机数表，`table[player][k][action]` 为 `player` 倒数第 k+1 步落子在 `action` 处对应的随机数 """
+        if board_len not in cls._history_zobrist_tables:
+            table = np.random.SeedSequence(1).generate_state(
+                2*3*board_len**2, dtype=np.uint64).reshape(2, 3, board_len**2)
+            cls._history_zobrist_tables[board_len] = table.tolist()
+
+        return cls._history_zobrist_tables[board_len]
+
+    @property
+    def history_hash(self) -> int:
+        """ 局面和双方最近落点的 Zobrist 哈希值，`history_hash` 相同的棋盘的特征平面相同 """
+        key = self.hash
+        for player in (self.WHITE, self.BLACK):
+            table = self._history_zobrist[player]
+            for k, action in zip(range(self._n_hash_history), self._last_moves[player]):
+                key ^= table[k][action]
+
+        return key
+
     def get_feature_planes(self) -> torch.Tensor:
-        """ 棋盘状态特征张量，维度为 `(n_feature_planes, board_len, board_len)`
+        """ 按位压缩的棋盘状态特征张量，维度为 `(board_len, board_len)`
 
         Returns
         -------
-        feature_planes: Tensor of shape `(n_feature_planes, board_len, board_len)`
-            特征平面图像
+        feature_planes: Tensor of shape `(board_len, board_len)`
+            `torch.uint8` 类型的特征平面，第 i 位对应第 i 张特征平面，可以用 `PolicyValueNet.unpack_feature_planes`
+            解压。和复制出来的棋盘共用一个缓冲区，下一次调用时会被覆盖，需要保存时请调用 `clone()`
         """
         n = self.board_len
-        feature_planes = torch.zeros((self.n_feature_planes, n**2))
         # 最后一张图像代表当前玩家颜色
         # feature_planes[-1] = self.current_player
         # 添加历史信息
-        if self.state:
-            actions = np.array(list(self.state.keys()))[::-1]
-            players = np.array(list(self.state.values()))[::-1]
-            Xt = actions[players == self.current_player]
-            Yt = actions[players != self.current_player]
-            for i in range((self.n_feature_planes-1)//2):
-                if i < len(Xt):
-                    feature_planes[2*i, Xt[i:]] = 1
-                if i < len(Yt):
-                    feature_planes[2*i+1, Yt[i:]] = 1
-
-        return feature_planes.view(self.n_feature_planes, n, n)
+        opponent = self.WHITE + self.BLACK - self.current_player
+        n_history, pad = len(self._moves_pad), self._moves_pad
+        self._moves_buf[:] = ((*self._last_moves[self.current_player], *pad)[:n_history] +
+                              (*self._last_moves[opponent], *pad)[:n_history])
+        build_planes(self._board, self._plane_luts[self.current_player], self._moves_buf,
+                     self._plane_keep_masks, self._plane_buf_np)
+        return self._plane_buf.view(n, n)
+
+    @classmethod
+    def _get_plane_masks(cls, n_feature_planes: int):
+        """ 计算构造历史特征平面需要的位掩码
+
+        Parameters
+        ----------
+        n_feature_planes: int
+            特征平面个数
+
+        Returns
+        -------
+        luts: Tuple[np.ndarray, np.ndarray]
+            `luts[current_player][color]` 为颜色为 `color` 的棋子在所有历史特征平面上对应的位，最后一项对应空位
+
+        keep_masks: `np.ndarray` of shape `(2, n_history)`
+            `keep_masks[0][k]` 和 `keep_masks[1][k]` 分别为当前玩家和对手倒数第 k+1 步的棋子需要保留的位
+        """
+        if n_feature_planes not in cls._plane_masks:
+            # 第 2i 位为当前玩家撤回最后 i 步后的棋子，第 2i+1 位为对手的棋子
+            n_history = (n_feature_planes - 1)//2
+            bits = [sum(1 << (2*i + offset) for i in range(n_history))
+                    for offset in (0, 1)]
+
+            luts = np.zeros((2, 3), dtype=np.uint8)
+            for player in (cls.WHITE, cls.BLACK):
+                luts[player, player] = bits[0]
+                luts[player, cls.WHITE + cls.BLACK - player] = bits[1]
+
+            keep_masks = np.array(
+                [[0xff & ~sum(1 << (2*i + offset) for i in range(k + 1, n_history))
+                  for k in range(n_history)] for offset in (0, 1)], dtype=np.uint8).reshape(2, n_history)
+            cls._plane_masks[n_feature_planes] = (tuple(luts), keep_masks)
+
+        return cls._plane_masks[n_feature_planes]
+
+
+# Python 实现的棋盘，没有编译 C++ 扩展时 ChessBoard 就是 PyChessBoard
+PyChessBoard = ChessBoard
+
+if _CppChessBoard is not None:
+
+    class ChessBoard(_CppChessBoard):
+        """ C++ 实现的棋盘，接口和 `PyChessBoard` 相同，运行 `utils/build_chess_board.py` 编译之后自动使用 """
+
+        EMPTY = PyChessBoard.EMPTY
+        WHITE = PyChessBoard.WHITE
+        BLACK = PyChessBoard.BLACK
+
+        def __init__(self, board_len=9, n_feature_planes=7):
+            """
+            Parameters
+            ----------
+            board_len: int
+                棋盘边长
+
+            n_feature_planes: int
+                特征平面的个数，必须为偶数，特征平面按位压缩在一个字节中，所以不能超过 8
+            """
+            zobrist = np.array(PyChessBoard._get_zobrist_table(board_len), dtype=np.uint64)
+            history_zobrist = np.array(
+                PyChessBoard._get_history_zobrist_table(board_len), dtype=np.uint64)
+            super().__init__(board_len, n_feature_planes, zobrist, history_zobrist)
+            self._plane_buf = torch.zeros(board_len**2, dtype=torch.uint8)
+            self._plane_buf_np = self._plane_buf.numpy()
+
+        def copy(self):
+            """ 复制棋盘 """
+            board = ChessBoard.__new__(ChessBoard)
+            _CppChessBoard.__init__(board, self)
+            # 特征平面在使用时会被立即拷贝，所以可以共享缓冲区
+            board._plane_buf = self._plane_buf
+            board._plane_buf_np = self._plane_buf_np
+            return board
+
+        def __copy__(self):
+            return self.copy()
+
+        def get_feature_planes(self) -> torch.Tensor:
+            """ 按位压缩的棋盘状态特征张量，和 `PyChessBoard.get_feature_planes` 相同 """
+            self.feature_planes(self._plane_buf_np)
+            n = self.board_len
+            return self._plane_buf.view(n, n)
 
 
 class ColorError(ValueError):
@@ -0,0 +1,83 @@
+# coding: utf-8
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """ 没有安装 numba 时直接使用 Python 函数 """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def check_five(board: np.ndarray, action: int, player: int, n: int) -> bool:
+    """ 判断 `player` 在 `action` 处落子后是否连成五子
+
+    Parameters
+    ----------
+    board: `np.ndarray` of shape `(n^2, )`
+        棋盘数组，每个元素为该位置上棋子的颜色
+
+    action: int
+        落子位置
+
+    player: int
+        落子玩家
+
+    n: int
+        棋盘边长
+    """
+    row, col = action // n, action % n
+
+    # 依次为水平、竖直、主对角线和副对角线方向
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        count = 1
+        # 沿正反两个方向统计相同颜色的棋子个数，数到五个就不再继续
+        for sign in (1, -1):
+            row_t, col_t = row + sign*dr, col + sign*dc
+            while count < 5 and 0 <= row_t < n and 0 <= col_t < n and board[row_t*n+col_t] == player:
+                count += 1
+                row_t += sign*dr
+                col_t += sign*dc
+
+            if count >= 5:
+                return True
+
+    return False
+
+
+@njit(cache=True)
+def build_planes(board: np.ndarray, lut: np.ndarray, moves: np.ndarray, keep_masks: np.ndarray, out: np.ndarray):
+    """ 根据棋盘数组和双方最近的落点构造按位压缩的历史特征平面
+
+    Parameters
+    ----------
+    board: `np.ndarray` of shape `(n^2, )`
+        棋盘数组，每个元素为该位置上棋子的颜色，空位为 -1
+
+    lut: `np.ndarray` of shape `(3, )`
+        `lut[color]` 为颜色为 `color` 的棋子在所有历史特征平面上对应的位，最后一项对应空位
+
+    moves: `np.ndarray` of shape `(2*n_history, )`
+        前一半为当前玩家最近的落点，后一半为对手最近的落点，最新的在最前面，不足 `n_history` 步时用 -1 填充。
+        使用定长的 `int16` 数组，numba 只需要编译一次
+
+    keep_masks: `np.ndarray` of shape `(2, n_history)`
+        倒数第 k+1 步的棋子需要保留的位，第一行对应当前玩家，第二行对应对手
+
+    out: `np.ndarray` of shape `(n^2, )`
+        输出的 `uint8` 数组，第 `2i` 位为当前玩家撤回最后 i 步后的棋子，第 `2i+1` 位为对手的棋子
+    """
+    for action in range(board.shape[0]):
+        out[action] = lut[board[action]]
+
+    # 撤回最后 i 步之后，倒数第 k+1 步下的棋子只出现在前 k+1 张历史特征平面上
+    n_history = keep_masks.shape[1]
+    for i in range(2):
+        for k in range(n_history):
+            action = moves[i*n_history + k]
+            if action < 0:
+                break
+            out[action] &= keep_masks[i, k]
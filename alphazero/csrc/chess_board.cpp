@@ -0,0 +1,279 @@
+// C++ 实现的棋盘，由 alphazero/chess_board.py 中的 ChessBoard 子类包装，
+// 编译方法见 utils/build_chess_board.py
+#include <pybind11/numpy.h>
+#include <pybind11/pybind11.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace py = pybind11;
+
+class ChessBoard {
+public:
+    static constexpr int EMPTY = -1;
+    static constexpr int WHITE = 0;
+    static constexpr int BLACK = 1;
+    // 特征平面按位压缩在一个字节中，所以最多有 3 步历史
+    static constexpr int MAX_HISTORY = 3;
+
+    ChessBoard(int board_len, int n_feature_planes, py::array_t<uint64_t, py::array::c_style> zobrist,
+               py::array_t<uint64_t, py::array::c_style> history_zobrist)
+        : board_len(board_len),
+          n_feature_planes(n_feature_planes),
+          current_player(BLACK),
+          n_(board_len * board_len),
+          n_history_((n_feature_planes - 1) / 2),
+          board_(n_, EMPTY),
+          available_(n_, 1),
+          n_available_(n_),
+          winner_(EMPTY),
+          hash_(0),
+          n_last_{0, 0} {
+        if (n_feature_planes > 8)
+            throw py::value_error("特征平面的个数不能超过 8");
+        if (zobrist.size() != 2 * n_)
+            throw py::value_error("Zobrist 随机数表的维度必须为 (board_len^2, 2)");
+        if (history_zobrist.size() != 2 * MAX_HISTORY * n_)
+            throw py::value_error("最近落点的 Zobrist 随机数表的维度必须为 (2, 3, board_len^2)");
+
+        // Zobrist 随机数表在复制出来的棋盘之间共享
+        auto table = zobrist.unchecked<2>();
+        auto zobrist_table = std::make_shared<std::vector<uint64_t>>(2 * n_);
+        for (int i = 0; i < n_; ++i) {
+            (*zobrist_table)[2 * i] = table(i, 0);
+            (*zobrist_table)[2 * i + 1] = table(i, 1);
+        }
+        zobrist_ = zobrist_table;
+
+        // history_zobrist[player][k][action] 为 player 倒数第 k+1 步落子在 action 处对应的随机数
+        auto history_table = history_zobrist.unchecked<3>();
+        auto history_zobrist_table = std::make_shared<std::vector<uint64_t>>(2 * MAX_HISTORY * n_);
+        for (int player = 0; player < 2; ++player)
+            for (int k = 0; k < MAX_HISTORY; ++k)
+                for (int i = 0; i < n_; ++i)
+                    (*history_zobrist_table)[(player * MAX_HISTORY + k) * n_ + i] = history_table(player, k, i);
+        history_zobrist_ = history_zobrist_table;
+
+        // 第 2i 位为当前玩家撤回最后 i 步后的棋子，第 2i+1 位为对手的棋子
+        for (int offset = 0; offset < 2; ++offset) {
+            uint8_t bits = 0;
+            for (int i = 0; i < n_history_; ++i)
+                bits |= 1 << (2 * i + offset);
+            all_bits_[offset] = bits;
+
+            // 撤回最后 i 步之后，倒数第 k+1 步下的棋子只出现在前 k+1 张历史特征平面上
+            for (int k = 0; k < n_history_; ++k) {
+                uint8_t keep = bits;
+                for (int i = k + 1; i < n_history_; ++i)
+                    keep &= ~(1 << (2 * i + offset));
+                keep_masks_[offset][k] = keep;
+            }
+        }
+    }
+
+    ChessBoard(const ChessBoard &) = default;
+
+    void clear_board() {
+        std::fill(board_.begin(), board_.end(), EMPTY);
+        std::fill(available_.begin(), available_.end(), 1);
+        n_available_ = n_;
+        moves_.clear();
+        n_last_[0] = n_last_[1] = 0;
+        winner_ = EMPTY;
+        hash_ = 0;
+        current_player = BLACK;
+        available_actions_ = py::object();
+    }
+
+    void do_action(int action) {
+        // 和 Python 实现的棋盘相同，位置上已经有棋子或者超出棋盘范围时抛出 ValueError
+        if (action < 0 || action >= n_ || !available_[action])
+            throw py::value_error("不能在位置 " + std::to_string(action) + " 落子");
+
+        available_[action] = 0;
+        --n_available_;
+        available_actions_ = py::object();
+        moves_.push_back(action);
+        push_last_move(current_player, action);
+        board_[action] = current_player;
+        hash_ ^= (*zobrist_)[2 * action + current_player];
+
+        // 如果下的棋子不到 9 个，就不可能分出胜负
+        if (moves_.size() >= 9 && check_five(action, current_player))
+            winner_ = current_player;
+
+        current_player = WHITE + BLACK - current_player;
+    }
+
+    bool do_action_(py::tuple pos) {
+        int action = pos[0].cast<int>() * board_len + pos[1].cast<int>();
+        if (0 <= action && action < n_ && available_[action]) {
+            do_action(action);
+            return true;
+        }
+        return false;
+    }
+
+    py::tuple is_game_over() const {
+        // 分出胜负
+        if (winner_ != EMPTY)
+            return py::make_tuple(true, winner_);
+
+        // 平局
+        if (n_available_ == 0)
+            return py::make_tuple(true, py::none());
+
+        return py::make_tuple(false, py::none());
+    }
+
+    py::object available_actions() {
+        // 可用落点列表只在需要时生成，不会被原地修改，所以复制出来的棋盘可以共享
+        if (!available_actions_) {
+            py::list actions(n_available_);
+            for (int i = 0, j = 0; i < n_; ++i)
+                if (available_[i])
+                    actions[j++] = py::int_(i);
+            available_actions_ = actions;
+        }
+        return available_actions_;
+    }
+
+    py::int_ available_mask() const {
+        // 第 i 位为 1 代表 action=i 处可以落子，每次拼接 64 位
+        py::int_ mask(0);
+        for (int start = (n_ - 1) / 64 * 64; start >= 0; start -= 64) {
+            uint64_t word = 0;
+            for (int i = std::min(start + 64, n_) - 1; i >= start; --i)
+                word = word << 1 | available_[i];
+            mask = py::int_((mask << py::int_(64)) | py::int_(word));
+        }
+        return mask;
+    }
+
+    py::dict state() const {
+        py::dict state;
+        for (size_t i = 0; i < moves_.size(); ++i)
+            state[py::int_(moves_[i])] = board_[moves_[i]];
+        return state;
+    }
+
+    py::object previous_action() const {
+        if (moves_.empty())
+            return py::none();
+        return py::int_(moves_.back());
+    }
+
+    uint64_t hash() const { return hash_; }
+
+    uint64_t history_hash() const {
+        // 倒数第 n_history 步以前的棋子出现在所有历史特征平面上，所以特征平面只和最近 n_history-1 步有关
+        uint64_t key = hash_;
+        for (int player = 0; player < 2; ++player)
+            for (int k = 0; k < std::min(n_last_[player], n_history_ - 1); ++k)
+                key ^= (*history_zobrist_)[(player * MAX_HISTORY + k) * n_ + last_moves_[player][k]];
+        return key;
+    }
+
+    void feature_planes(py::array_t<uint8_t, py::array::c_style> out) {
+        if (out.size() != n_)
+            throw py::value_error("特征平面缓冲区的大小必须为 board_len^2");
+
+        auto buf = out.mutable_unchecked<1>();
+        int current = current_player, opponent = WHITE + BLACK - current_player;
+
+        // 先假设所有棋子都出现在每一张历史特征平面上
+        for (int i = 0; i < n_; ++i) {
+            int player = board_[i];
+            buf(i) = player == EMPTY ? 0 : all_bits_[player == current ? 0 : 1];
+        }
+
+        for (int k = 0; k < n_last_[current]; ++k)
+            buf(last_moves_[current][k]) &= keep_masks_[0][k];
+        for (int k = 0; k < n_last_[opponent]; ++k)
+            buf(last_moves_[opponent][k]) &= keep_masks_[1][k];
+    }
+
+    const int board_len;
+    const int n_feature_planes;
+    int current_player;
+
+private:
+    void push_last_move(int player, int action) {
+        // 最新的落点在最前面，只保留构造历史特征平面需要的步数
+        int16_t *moves = last_moves_[player];
+        int count = std::min(n_last_[player] + 1, n_history_);
+        for (int k = count - 1; k > 0; --k)
+            moves[k] = moves[k - 1];
+        if (count > 0)
+            moves[0] = action;
+        n_last_[player] = count;
+    }
+
+    bool check_five(int action, int player) const {
+        int row = action / board_len, col = action % board_len;
+        static const int directions[4][2] = {{0, 1}, {1, 0}, {1, 1}, {1, -1}};
+
+        // 依次为水平、竖直、主对角线和副对角线方向
+        for (const auto &direction : directions) {
+            int count = 1;
+            // 沿正反两个方向统计相同颜色的棋子个数，数到五个就不再继续
+            for (int sign = 1; sign >= -1; sign -= 2) {
+                int dr = sign * direction[0], dc = sign * direction[1];
+                int r = row + dr, c = col + dc;
+                while (count < 5 && 0 <= r && r < board_len && 0 <= c && c < board_len &&
+                       board_[r * board_len + c] == player) {
+                    ++count;
+                    r += dr;
+                    c += dc;
+                }
+
+                if (count >= 5)
+                    return true;
+            }
+        }
+
+        return false;
+    }
+
+    int n_;
+    int n_history_;
+    std::vector<int8_t> board_;
+    std::vector<uint8_t> available_;
+    int n_available_;
+    std::vector<int16_t> moves_;
+    int winner_;
+    uint64_t hash_;
+    std::shared_ptr<const std::vector<uint64_t>> zobrist_;
+    std::shared_ptr<const std::vector<uint64_t>> history_zobrist_;
+    int16_t last_moves_[2][MAX_HISTORY];
+    int n_last_[2];
+    uint8_t all_bits_[2];
+    uint8_t keep_masks_[2][MAX_HISTORY];
+    py::object available_actions_;
+};
+
+PYBIND11_MODULE(_chess_board_cpp, m) {
+    py::class_<ChessBoard>(m, "ChessBoard", py::dynamic_attr())
+        .def(py::init<int, int, py::array_t<uint64_t, py::array::c_style>,
+                      py::array_t<uint64_t, py::array::c_style>>(),
+             py::arg("board_len"), py::arg("n_feature_planes"), py::arg("zobrist"),
+             py::arg("history_zobrist"))
+        .def(py::init<const ChessBoard &>(), py::arg("chess_board"))
+        .def_readonly("board_len", &ChessBoard::board_len)
+        .def_readonly("n_feature_planes", &ChessBoard::n_feature_planes)
+        .def_readwrite("current_player", &ChessBoard::current_player)
+        .def_property_readonly("available_actions", &ChessBoard::available_actions)
+        .def_property_readonly("available_mask", &ChessBoard::available_mask)
+        .def_property_readonly("state", &ChessBoard::state)
+        .def_property_readonly("previous_action", &ChessBoard::previous_action)
+        .def_property_readonly("hash", &ChessBoard::hash)
+        .def_property_readonly("history_hash", &ChessBoard::history_hash)
+        .def("clear_board", &ChessBoard::clear_board)
+        .def("do_action", &ChessBoard::do_action, py::arg("action"))
+        .def("do_action_", &ChessBoard::do_action_, py::arg("pos"))
+        .def("is_game_over", &ChessBoard::is_game_over)
+        .def("feature_planes", &ChessBoard::feature_planes, py::arg("out"));
+}
@@ -24,6 +24,7 @@ class Node:
         self.N = 0
         self.score = 0
         self.P = prior_prob
+        self.virtual_loss = 0
         self.c_puct = c_puct
         self.parent = parent
         self.children = {}  # type:Dict[int, Node]
@@ -71,10 +72,28 @@ class Node:
 
         self.__update(value)
 
+    def add_virtual_loss(self, virtual_loss: float):
+        """ 给从当前节点到根节点路径上的所有节点施加虚拟损失，使并行搜索尽量选择不同的路径
+
+        Parameters
+        ----------
+        virtual_loss: float
+            虚拟损失，施加在节点上时相当于访问了 `virtual_loss` 次且每次都输掉，
+            传入负数时撤销虚拟损失
+        """
+        node = self
+        while node:
+            node.virtual_loss += virtual_loss
+            node = node.parent
+
     def get_score(self):
         """ 计算节点得分 """
-        self.U = self.c_puct * self.P * sqrt(self.parent.N)/(1 + self.N)
-        self.score = self.U + self.Q
+        # 将虚拟损失视为已经访问过且输掉的次数
+        n = self.N + self.virtual_loss
+        q = (self.N*self.Q - self.virtual_loss)/n if n else 0
+        self.U = self.c_puct * self.P * \
+            sqrt(self.parent.N + self.parent.virtual_loss)/(1 + n)
+        self.score = self.U + q
         return self.score
 
     def is_leaf_node(self):
@@ -1,4 +1,8 @@
 # coding: utf-8
+import threading
+from copy import deepcopy
+from typing import List
+
 import torch
 from torch import nn
 from torch.nn import functional as F
@@ -126,14 +130,17 @@ class PolicyValueNet(nn.Module):
             *[ResidueBlock(128, 128) for i in range(4)])
         self.policy_head = PolicyHead(128, board_len)
         self.value_head = ValueHead(128, board_len)
+        # 权重可能还没有移动到设备上，所以第一次推理时再导出推理模型
+        self.__dict__['_inference_lock'] = threading.Lock()
+        self.clear_inference_net()
 
     def forward(self, x):
         """ 前馈，输出 `p_hat` 和 `V`
 
         Parameters
         ----------
-        x: Tensor of shape (N, C, H, W)
-            棋局的状态特征平面张量
+        x: Tensor of shape (N, C, H, W) or (N, H, W)
+            棋局的状态特征平面张量，也可以是 `ChessBoard.get_feature_planes` 返回的按位压缩的 `torch.uint8` 张量
 
         Returns
         -------
@@ -143,12 +150,33 @@ class PolicyValueNet(nn.Module):
         value: Tensor of shape (N, 1)
             当前局面的估值
         """
+        if x.dtype == torch.uint8:
+            x = self.unpack_feature_planes(x)
+
         x = self.conv(x)
         x = self.residues(x)
         p_hat = self.policy_head(x)
         value = self.value_head(x)
         return p_hat, value
 
+    def unpack_feature_planes(self, x: torch.Tensor) -> torch.Tensor:
+        """ 解压按位压缩的特征平面
+
+        Parameters
+        ----------
+        x: Tensor of shape (N, H, W)
+            `torch.uint8` 类型的特征平面，第 i 位对应第 i 张特征平面
+
+        Returns
+        -------
+        feature_planes: Tensor of shape (N, n_feature_planes, H, W)
+            和网络权重数据类型相同的特征平面
+        """
+        bits = torch.arange(self.n_feature_planes,
+                            dtype=torch.uint8, device=x.device)
+        x = (x.unsqueeze(1) >> bits.view(1, -1, 1, 1)) & 1
+        return x.to(self.conv.conv.weight.dtype)
+
     def predict(self, chess_board: ChessBoard):
         """ 获取当前局面上所有可用 `action` 和他对应的先验概率 `P(s, a)`，以及局面的 `value`
 
@@ -165,22 +193,198 @@ class PolicyValueNet(nn.Module):
         value: float
             当前局面的估值
         """
-        feature_planes = chess_board.get_feature_planes().to(self.device)
-        feature_planes.unsqueeze_(0)
-        p_hat, value = self(feature_planes)
+        return self.predict_batch([chess_board])[0]
+
+    def predict_batch(self, chess_boards: List[ChessBoard]):
+        """ 对多个局面进行一次批量前馈，获取每个局面上可用 `action` 的先验概率和局面的 `value`
+
+        Parameters
+        ----------
+        chess_boards: List[ChessBoard]
+            棋盘列表
+
+        Returns
+        -------
+        results: List[Tuple[np.ndarray, float]]
+            每个元素为对应棋盘的 `(probs, value)` 元组，含义与 `predict` 的返回值相同
+        """
+        return self.predict_batch_async(chess_boards)()
+
+    def predict_batch_async(self, chess_boards: List[ChessBoard]):
+        """ 异步地对多个局面进行一次批量前馈，返回一个等待前馈完成并返回 `predict_batch` 结果的函数
+
+        Parameters
+        ----------
+        chess_boards: List[ChessBoard]
+            棋盘列表，调用返回的函数之前不能再修改这些棋盘
+
+        Returns
+        -------
+        get_results: Callable[[], List[Tuple[np.ndarray, float]]]
+            等待前馈完成并返回结果的函数
+        """
+        # 特征平面直接写入锁页内存，省去一次拷贝
+        n = self.board_len
+        feature_planes = torch.empty(
+            len(chess_boards), n, n, dtype=torch.uint8, pin_memory=self.is_use_gpu)
+        for i, board in enumerate(chess_boards):
+            feature_planes[i] = board.get_feature_planes()
+
+        wait = self.predict_feature_planes_async(feature_planes)
+
+        def get_results():
+            p, value = wait()
+
+            # 只取可行的落点
+            return [(p[i, board.available_actions], float(value[i]))
+                    for i, board in enumerate(chess_boards)]
+
+        return get_results
+
+    def predict_feature_planes(self, feature_planes: torch.Tensor):
+        """ 对一批特征平面进行前馈，获取所有 `action` 的先验概率和局面的 `value`
+
+        Parameters
+        ----------
+        feature_planes: Tensor of shape `(N, board_len, board_len)`
+            位于 CPU 上的按位压缩的 `torch.uint8` 特征平面，在设备上解压以减少传输的数据量
+
+        Returns
+        -------
+        probs: `np.ndarray` of shape `(N, board_len^2)`
+            每个局面上所有 `action` 对应的先验概率
+
+        value: `np.ndarray` of shape `(N, )`
+            每个局面的估值
+        """
+        return self.predict_feature_planes_async(feature_planes)()
+
+    def predict_feature_planes_async(self, feature_planes: torch.Tensor):
+        """ 异步地对一批特征平面进行前馈，返回一个等待前馈完成并返回 `predict_feature_planes` 结果的函数
+
+        在 GPU 上时，拷贝和前馈都在单独的 CUDA 流中执行，调用返回的函数之前 CPU 可以继续搜索；
+        在 CPU 上时直接同步前馈
+
+        Parameters
+        ----------
+        feature_planes: Tensor of shape `(N, board_len, board_len)`
+            位于 CPU 上的按位压缩的 `torch.uint8` 特征平面
+
+        Returns
+        -------
+        get_results: Callable[[], Tuple[np.ndarray, np.ndarray]]
+            等待前馈完成并返回 `(probs, value)` 的函数
+        """
+        if not self.is_use_gpu:
+            with torch.inference_mode():
+                p_hat, value = self.get_inference_net()(feature_planes)
+                # 将对数概率转换为概率，转回单精度保证数值稳定
+                p = torch.exp(p_hat.float()).numpy()
+                value = value.float().flatten().numpy()
+
+            return lambda: (p, value)
+
+        # 只有锁页内存才能和计算重叠地异步拷贝
+        if not feature_planes.is_pinned():
+            feature_planes = feature_planes.pin_memory()
+
+        net = self.get_inference_net()
+        stream = self.__get_stream()
+        stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.inference_mode(), torch.cuda.stream(stream):
+            x = feature_planes.to(self.device, non_blocking=True)
+            p_hat, value = net(x)
+            p_hat = torch.exp(p_hat.float())
+            value = value.float().flatten()
+
+            # 异步地拷贝回锁页内存，并记录拷贝完成的事件
+            p = torch.empty(p_hat.shape, pin_memory=True)
+            v = torch.empty(value.shape, pin_memory=True)
+            p.copy_(p_hat, non_blocking=True)
+            v.copy_(value, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(stream)
+
+        def get_results():
+            event.synchronize()
+            return p.numpy(), v.numpy()
+
+        return get_results
+
+    def __get_stream(self):
+        """ 获取推理使用的 CUDA 流 """
+        stream = self.__dict__.get('_stream')
+        if stream is None:
+            stream = torch.cuda.Stream(self.device)
+            self.__dict__['_stream'] = stream
+
+        return stream
+
+    @property
+    def is_async(self):
+        """ `predict_batch_async` 是否真正异步地前馈，只有在 GPU 上前馈时才能和搜索重叠 """
+        return self.is_use_gpu
+
+    @property
+    def inference_dtype(self):
+        """ 推理模型的数据类型，在 GPU 上使用半精度推理，训练仍然使用单精度 """
+        return torch.float16 if self.is_use_gpu else torch.float32
+
+    def get_inference_net(self):
+        """ 获取用于推理的 TorchScript 模型，如果模型不存在就根据当前权重导出一个
+
+        推理服务器线程和主线程共用一个推理模型，导出时需要加锁，防止两个线程同时导出
+        """
+        net = self.__dict__.get('_inference_net')
+        if net is None:
+            with self.__dict__['_inference_lock']:
+                net = self.__dict__.get('_inference_net')
+                if net is None:
+                    net = self.__export_inference_net()
+                    self.__dict__['_inference_net'] = net
+
+        return net
+
+    def update_inference_net(self):
+        """ 根据当前权重导出新的推理模型，权重更新之后需要在训练线程中调用此函数
+
+        新模型导出完成之后才会替换旧模型，其他线程在导出期间继续使用旧模型，不会读到更新了一半的权重
+        """
+        with self.__dict__['_inference_lock']:
+            net = self.__export_inference_net()
+            self.__dict__['_inference_net'] = net
 
-        # 将对数概率转换为概率
-        p = torch.exp(p_hat).flatten()
+    def clear_inference_net(self):
+        """ 丢弃旧的推理模型，设备改变之后需要调用此函数，下一次推理时会根据当前权重重新导出 """
+        self.__dict__['_inference_net'] = None
 
-        # 只取可行的落点
-        if self.is_use_gpu:
-            p = p[chess_board.available_actions].cpu().detach().numpy()
-        else:
-            p = p[chess_board.available_actions].detach().numpy()
+    def __export_inference_net(self):
+        """ 根据当前权重导出冻结的 TorchScript 模型 """
+        dtype = self.inference_dtype
+        example = torch.zeros(1, self.board_len, self.board_len,
+                              device=self.device, dtype=torch.uint8)
+        with torch.no_grad():
+            net = torch.jit.trace(deepcopy(self).eval().to(dtype), example)
 
-        return p, value[0].item()
+        return torch.jit.freeze(net)
 
     def set_device(self, is_use_gpu: bool):
         """ 设置神经网络运行设备 """
         self.is_use_gpu = is_use_gpu
         self.device = torch.device('cuda:0' if is_use_gpu else 'cpu')
+        self.__dict__['_stream'] = None
+        self.clear_inference_net()
+
+    def __getstate__(self):
+        # 推理模型由权重导出，CUDA 流和锁无法序列化，都不需要保存
+        state = self.__dict__.copy()
+        state.pop('_inference_net', None)
+        state.pop('_stream', None)
+        state.pop('_inference_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.__dict__['_inference_lock'] = threading.Lock()
+        self.__dict__.setdefault('_stream', None)
+        self.clear_inference_net()
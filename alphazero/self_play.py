@@ -0,0 +1,258 @@
+# coding:utf-8
+import queue
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from .alpha_zero_mcts import AlphaZeroMCTS
+from .chess_board import ChessBoard
+from .policy_value_net import PolicyValueNet
+from .self_play_dataset import SelfPlayData
+
+
+def self_play(mcts: AlphaZeroMCTS, chess_board: ChessBoard) -> Tuple[SelfPlayData, List[int]]:
+    """ 自我博弈一局
+
+    Parameters
+    ----------
+    mcts: AlphaZeroMCTS
+        处于自我博弈状态的蒙特卡洛搜索树
+
+    chess_board: ChessBoard
+        棋盘
+
+    Returns
+    -------
+    self_play_data: namedtuple
+        自我博弈数据，有以下三个成员:
+        * `pi_list`: 蒙特卡洛树搜索产生的动作概率向量 π 组成的列表
+        * `z_list`: 一局之中每个动作的玩家相对最后的游戏结果的奖赏，为 `np.int8` 数组
+        * `feature_planes_list`: 一局之中每个动作对应的特征平面组成的列表
+
+    action_list: List[int]
+        棋谱
+    """
+    # 初始化棋盘和数据容器
+    chess_board.clear_board()
+    pi_list, feature_planes_list, players = [], [], []
+    action_list = []
+
+    # 开始一局游戏
+    while True:
+        action, pi = mcts.get_action(chess_board)
+
+        # 保存每一步的数据
+        feature_planes_list.append(chess_board.get_feature_planes().clone())
+        players.append(chess_board.current_player)
+        action_list.append(action)
+        pi_list.append(pi)
+        chess_board.do_action(action)
+
+        # 判断游戏是否结束
+        is_over, winner = chess_board.is_game_over()
+        if is_over:
+            players = np.fromiter(players, dtype=np.int8, count=len(players))
+            if winner is not None:
+                z_list = np.where(players == winner, 1, -1).astype(np.int8)
+            else:
+                z_list = np.zeros(len(players), dtype=np.int8)
+            break
+
+    # 重置根节点
+    mcts.reset_root()
+
+    self_play_data = SelfPlayData(
+        pi_list=pi_list, z_list=z_list, feature_planes_list=feature_planes_list)
+    return self_play_data, action_list
+
+
+class InferenceClient:
+    """ 自我博弈进程中的策略价值网络代理，将特征平面发送给推理服务器进行批量前馈 """
+
+    def __init__(self, worker_id: int, request_queue, response_queue):
+        """
+        Parameters
+        ----------
+        worker_id: int
+            自我博弈进程的编号
+
+        request_queue: Queue
+            发送推理请求的队列，所有自我博弈进程共用
+
+        response_queue: Queue
+            接收推理结果的队列，每个自我博弈进程一个
+        """
+        self.worker_id = worker_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+
+    # 推理服务器在另一个线程中前馈，等待结果期间可以继续搜索
+    is_async = True
+
+    def predict_batch(self, chess_boards: List[ChessBoard]):
+        """ 获取每个局面上可用 `action` 的先验概率和局面的 `value`，返回值和 `PolicyValueNet.predict_batch` 相同 """
+        return self.predict_batch_async(chess_boards)()
+
+    def predict_batch_async(self, chess_boards: List[ChessBoard]):
+        """ 发送推理请求，返回一个等待推理结果的函数，返回值和 `PolicyValueNet.predict_batch_async` 相同 """
+        board = chess_boards[0]
+        n = board.board_len
+        feature_planes = np.empty((len(chess_boards), n, n), dtype=np.uint8)
+        for i, board in enumerate(chess_boards):
+            feature_planes[i] = board.get_feature_planes().numpy()
+
+        self.request_queue.put((self.worker_id, feature_planes))
+
+        def get_results():
+            # 服务器按照请求的顺序返回结果
+            p, value = self.response_queue.get()
+
+            # 只取可行的落点
+            return [(p[i, board.available_actions], float(value[i]))
+                    for i, board in enumerate(chess_boards)]
+
+        return get_results
+
+
+class InferenceServer(threading.Thread):
+    """ 推理服务器，合并多个自我博弈进程的请求后用策略价值网络进行一次前馈 """
+
+    def __init__(self, policy_value_net: PolicyValueNet, request_queue, response_queues: list):
+        """
+        Parameters
+        ----------
+        policy_value_net: PolicyValueNet
+            策略价值网络，权重更新后推理服务器会自动使用新的推理模型
+
+        request_queue: Queue
+            推理请求队列
+
+        response_queues: list
+            每个自我博弈进程的推理结果队列
+        """
+        super().__init__(daemon=True)
+        self.policy_value_net = policy_value_net
+        self.request_queue = request_queue
+        self.response_queues = response_queues
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                requests = [self.request_queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            # 每个进程同时最多有两个请求，所以一次最多合并两倍进程数个请求
+            while len(requests) < 2*len(self.response_queues):
+                try:
+                    requests.append(self.request_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            feature_planes = torch.from_numpy(
+                np.concatenate([i[1] for i in requests]))
+            p, value = self.policy_value_net.predict_feature_planes(
+                feature_planes)
+
+            # 将结果发回对应的进程
+            start = 0
+            for worker_id, planes in requests:
+                end = start + len(planes)
+                self.response_queues[worker_id].put(
+                    (p[start:end], value[start:end]))
+                start = end
+
+    def stop(self):
+        """ 停止推理服务器 """
+        self.stop_event.set()
+
+
+def _self_play_worker(worker_id: int, request_queue, response_queue, game_queue, board_len: int,
+                      n_feature_planes: int, c_puct: float, n_mcts_iters: int, mcts_batch_size: int):
+    """ 自我博弈进程，不断地进行自我博弈并将数据放入 `game_queue` """
+    torch.set_num_threads(1)
+    chess_board = ChessBoard(board_len, n_feature_planes)
+    client = InferenceClient(worker_id, request_queue, response_queue)
+    mcts = AlphaZeroMCTS(client, c_puct=c_puct, n_iters=n_mcts_iters,
+                         is_self_play=True, batch_size=mcts_batch_size)
+
+    while True:
+        self_play_data, action_list = self_play(mcts, chess_board)
+
+        # 使用 numpy 数组传输特征平面，避免为每个张量创建共享内存
+        feature_planes_list = [i.numpy() for i in self_play_data.feature_planes_list]
+        self_play_data = self_play_data._replace(
+            feature_planes_list=feature_planes_list)
+        game_queue.put((self_play_data, action_list))
+
+
+class SelfPlayWorkers:
+    """ 多进程自我博弈，每个进程独立地进行自我博弈，策略价值网络的前馈由主进程中的推理服务器统一完成 """
+
+    def __init__(self, policy_value_net: PolicyValueNet, n_workers: int, board_len=9,
+                 n_feature_planes=6, c_puct=4, n_mcts_iters=500, mcts_batch_size=8):
+        """
+        Parameters
+        ----------
+        policy_value_net: PolicyValueNet
+            策略价值网络
+
+        n_workers: int
+            自我博弈进程数
+
+        board_len: int
+            棋盘大小
+
+        n_feature_planes: int
+            特征平面个数
+
+        c_puct: float
+            探索常数
+
+        n_mcts_iters: int
+            蒙特卡洛树搜索次数
+
+        mcts_batch_size: int
+            蒙特卡洛树搜索时每次批量评估的叶节点个数
+        """
+        # 在主线程中导出推理模型，推理服务器线程只读取已经导出的模型，不会和训练同时导出
+        policy_value_net.get_inference_net()
+
+        ctx = mp.get_context('spawn')
+        request_queue = ctx.Queue()
+        response_queues = [ctx.Queue() for _ in range(n_workers)]
+        self.game_queue = ctx.Queue(maxsize=2*n_workers)
+
+        self.server = InferenceServer(
+            policy_value_net, request_queue, response_queues)
+        self.server.start()
+
+        self.workers = []
+        for i in range(n_workers):
+            args = (i, request_queue, response_queues[i], self.game_queue, board_len,
+                    n_feature_planes, c_puct, n_mcts_iters, mcts_batch_size)
+            worker = ctx.Process(
+                target=_self_play_worker, args=args, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def get(self) -> Tuple[SelfPlayData, List[int]]:
+        """ 获取一局自我博弈数据，返回值和 `self_play` 相同 """
+        while True:
+            try:
+                return self.game_queue.get(timeout=1)
+            except queue.Empty:
+                if not self.server.is_alive() or not all(i.is_alive() for i in self.workers):
+                    raise RuntimeError('自我博弈进程或推理服务器意外退出')
+
+    def close(self):
+        """ 结束所有自我博弈进程和推理服务器 """
+        for worker in self.workers:
+            worker.terminate()
+
+        self.server.stop()
+        self.server.join()
@@ -1,8 +1,8 @@
 # coding:utf-8
-from collections import deque, namedtuple
+from collections import namedtuple
 
+import numpy as np
 import torch
-from torch import Tensor
 from torch.utils.data import Dataset
 
 SelfPlayData = namedtuple(
@@ -10,40 +10,107 @@ SelfPlayData = namedtuple(
 
 
 class SelfPlayDataSet(Dataset):
-    """ 自我博弈数据集类，每个样本为元组 `(feature_planes, pi, z)` """
+    """ 自我博弈数据集类，每个样本为元组 `(feature_planes, pi, z)`
 
-    def __init__(self, board_len=9):
+    样本保存在三个预先分配的环形缓冲区中，数据集满了之后新样本会覆盖最旧的样本，
+    特征平面为 `ChessBoard.get_feature_planes` 返回的按位压缩的 `torch.uint8` 张量
+    """
+
+    def __init__(self, board_len=9, capacity=10000):
+        """
+        Parameters
+        ----------
+        board_len: int
+            棋盘大小
+
+        capacity: int
+            数据集的最大样本数
+        """
         super().__init__()
-        self.__data_deque = deque(maxlen=10000)
         self.board_len = board_len
+        self.capacity = capacity
+        # 特征平面已经按位压缩，π 只需要半精度，z 只有 -1、0 和 1
+        n = board_len
+        self.buf_features = torch.empty((capacity, n, n), dtype=torch.uint8)
+        self.buf_pi = torch.empty((capacity, n**2), dtype=torch.float16)
+        self.buf_z = torch.empty(capacity, dtype=torch.int8)
+        # 下一个写入位置和样本数
+        self._idx = 0
+        self._size = 0
 
     def __len__(self):
-        return len(self.__data_deque)
+        return self._size
 
     def __getitem__(self, index):
-        return self.__data_deque[index]
+        if not 0 <= index < self._size:
+            raise IndexError('数据集索引越界')
+
+        # 按照插入顺序索引，0 为最旧的样本
+        index = (self._idx - self._size + index) % self.capacity
+        return (self.buf_features[index], self.buf_pi[index].float(),
+                self.buf_z[index].float())
 
     def clear(self):
         """ 清空数据集 """
-        self.__data_deque.clear()
+        self._idx = 0
+        self._size = 0
 
     def append(self, self_play_data: SelfPlayData):
         """ 向数据集中插入数据 """
         n = self.board_len
-        z_list = Tensor(self_play_data.z_list)
-        pi_list = self_play_data.pi_list
-        feature_planes_list = self_play_data.feature_planes_list
+        z = torch.as_tensor(np.asarray(self_play_data.z_list), dtype=torch.int8)
+        pi = torch.as_tensor(np.stack(self_play_data.pi_list)).view(-1, n, n)
+        feature_planes = torch.stack(
+            [torch.as_tensor(i) for i in self_play_data.feature_planes_list]).to(torch.uint8)
+
         # 使用翻转和镜像扩充已有数据集
-        for z, pi, feature_planes in zip(z_list, pi_list, feature_planes_list):
-            for i in range(4):
-                # 逆时针旋转 i*90°
-                rot_features = torch.rot90(Tensor(feature_planes), i, (1, 2))
-                rot_pi = torch.rot90(Tensor(pi.reshape(n, n)), i)
-                self.__data_deque.append(
-                    (rot_features, rot_pi.flatten(), z))
-
-                # 对逆时针旋转后的数组进行水平翻转
-                flip_features = torch.flip(rot_features, [2])
-                flip_pi = torch.fliplr(rot_pi)
-                self.__data_deque.append(
-                    (flip_features, flip_pi.flatten(), z))
+        features_list, pi_list = [], []
+        for i in range(4):
+            # 逆时针旋转 i*90°
+            rot_features = torch.rot90(feature_planes, i, (1, 2))
+            rot_pi = torch.rot90(pi, i, (1, 2))
+            features_list.append(rot_features)
+            pi_list.append(rot_pi)
+
+            # 对逆时针旋转后的数组进行水平翻转
+            features_list.append(torch.flip(rot_features, [2]))
+            pi_list.append(torch.flip(rot_pi, [2]))
+
+        self.__write(torch.cat(features_list), torch.cat(pi_list).flatten(1),
+                     z.repeat(len(features_list)))
+
+    def sample(self, batch_size: int):
+        """ 不放回地随机选出一批样本
+
+        Parameters
+        ----------
+        batch_size: int
+            样本个数，超过数据集大小时返回所有样本
+
+        Returns
+        -------
+        feature_planes: Tensor of shape `(batch_size, board_len, board_len)`
+            按位压缩的 `torch.uint8` 类型的特征平面
+
+        pi: Tensor of shape `(batch_size, board_len^2)`
+            `torch.float16` 类型的动作概率向量
+
+        z: Tensor of shape `(batch_size, )`
+            `torch.int8` 类型的奖赏
+        """
+        index = torch.randperm(self._size)[:batch_size]
+        return self.buf_features[index], self.buf_pi[index], self.buf_z[index]
+
+    def __write(self, features: torch.Tensor, pi: torch.Tensor, z: torch.Tensor):
+        """ 将样本写入环形缓冲区 """
+        # 一次写入的样本过多时只保留最新的样本
+        features = features[-self.capacity:]
+        pi, z = pi[-self.capacity:], z[-self.capacity:]
+
+        index = (self._idx + torch.arange(len(z))) % self.capacity
+        self.buf_features[index] = features
+        self.buf_pi[index] = pi.to(torch.float16)
+        self.buf_z[index] = z
+
+        self._idx = (self._idx + len(z)) % self.capacity
+        self._size = min(self._size + len(z), self.capacity)
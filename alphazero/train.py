@@ -8,12 +8,12 @@ import torch
 import torch.nn.functional as F
 from torch import nn, optim, cuda
 from torch.optim.lr_scheduler import MultiStepLR
-from torch.utils.data import DataLoader
 
 from .alpha_zero_mcts import AlphaZeroMCTS
 from .chess_board import ChessBoard
 from .policy_value_net import PolicyValueNet
-from .self_play_dataset import SelfPlayData, SelfPlayDataSet
+from .self_play import SelfPlayWorkers, self_play
+from .self_play_dataset import SelfPlayDataSet
 
 
 def exception_handler(train_func):
@@ -67,7 +67,8 @@ class TrainModel:
 
     def __init__(self, board_len=9, lr=0.01, n_self_plays=1500, n_mcts_iters=500,
                  n_feature_planes=4, batch_size=500, start_train_size=500, check_frequency=100,
-                 n_test_games=10, c_puct=4, is_use_gpu=True, is_save_game=False, **kwargs):
+                 n_test_games=10, c_puct=4, is_use_gpu=True, is_save_game=False, mcts_batch_size=8,
+                 n_self_play_workers=0, **kwargs):
         """
         Parameters
         ----------
@@ -106,6 +107,12 @@ class TrainModel:
 
         is_save_game: bool
             是否保存自对弈的棋谱
+
+        mcts_batch_size: int
+            蒙特卡洛树搜索时每次批量评估的叶节点个数
+
+        n_self_play_workers: int
+            自我博弈进程数，为 0 时在主进程中进行自我博弈
         """
         self.c_puct = c_puct
         self.is_use_gpu = is_use_gpu
@@ -114,16 +121,20 @@ class TrainModel:
         self.n_test_games = n_test_games
         self.n_mcts_iters = n_mcts_iters
         self.is_save_game = is_save_game
+        self.mcts_batch_size = mcts_batch_size
+        self.n_self_play_workers = n_self_play_workers
         self.check_frequency = check_frequency
         self.start_train_size = start_train_size
         self.device = torch.device(
             'cuda:0' if is_use_gpu and cuda.is_available() else 'cpu')
         self.chess_board = ChessBoard(board_len, n_feature_planes)
+        self.self_play_workers = None  # type:SelfPlayWorkers
 
         # 创建策略-价值网络和蒙特卡洛搜索树
         self.policy_value_net = self.__get_policy_value_net(board_len)
         self.mcts = AlphaZeroMCTS(
-            self.policy_value_net, c_puct=c_puct, n_iters=n_mcts_iters, is_self_play=True)
+            self.policy_value_net, c_puct=c_puct, n_iters=n_mcts_iters, is_self_play=True,
+            batch_size=mcts_batch_size)
 
         # 创建优化器和损失函数
         self.optimizer = optim.Adam(
@@ -147,65 +158,56 @@ class TrainModel:
         self_play_data: namedtuple
             自我博弈数据，有以下三个成员:
             * `pi_list`: 蒙特卡洛树搜索产生的动作概率向量 π 组成的列表
-            * `z_list`: 一局之中每个动作的玩家相对最后的游戏结果的奖赏列表
+            * `z_list`: 一局之中每个动作的玩家相对最后的游戏结果的奖赏，为 `np.int8` 数组
             * `feature_planes_list`: 一局之中每个动作对应的特征平面组成的列表
         """
-        # 初始化棋盘和数据容器
         self.policy_value_net.eval()
-        self.chess_board.clear_board()
-        pi_list, feature_planes_list, players = [], [], []
-        action_list = []
-
-        # 开始一局游戏
-        while True:
-            action, pi = self.mcts.get_action(self.chess_board)
-
-            # 保存每一步的数据
-            feature_planes_list.append(self.chess_board.get_feature_planes())
-            players.append(self.chess_board.current_player)
-            action_list.append(action)
-            pi_list.append(pi)
-            self.chess_board.do_action(action)
-
-            # 判断游戏是否结束
-            is_over, winner = self.chess_board.is_game_over()
-            if is_over:
-                if winner is not None:
-                    z_list = [1 if i == winner else -1 for i in players]
-                else:
-                    z_list = [0]*len(players)
-                break
-
-        # 重置根节点
-        self.mcts.reset_root()
+        if self.self_play_workers:
+            self_play_data, action_list = self.self_play_workers.get()
+        else:
+            self_play_data, action_list = self_play(
+                self.mcts, self.chess_board)
 
         # 返回数据
         if self.is_save_game:
             self.games.append(action_list)
 
-        self_play_data = SelfPlayData(
-            pi_list=pi_list, z_list=z_list, feature_planes_list=feature_planes_list)
         return self_play_data
 
     @exception_handler
     def train(self):
         """ 训练模型 """
+        if self.n_self_play_workers > 0:
+            self.self_play_workers = SelfPlayWorkers(
+                self.policy_value_net, self.n_self_play_workers, self.chess_board.board_len,
+                self.chess_board.n_feature_planes, self.c_puct, self.n_mcts_iters, self.mcts_batch_size)
+
+        try:
+            self.__train()
+        finally:
+            if self.self_play_workers:
+                self.self_play_workers.close()
+                self.self_play_workers = None
+
+    def __train(self):
+        """ 交替进行自我博弈和训练 """
         for i in range(self.n_self_plays):
             print(f'🏹 正在进行第 {i+1} 局自我博弈游戏...')
             self.dataset.append(self.__self_play())
 
             # 如果数据集中的数据量大于 start_train_size 就进行一次训练
             if len(self.dataset) >= self.start_train_size:
-                data_loader = iter(DataLoader(
-                    self.dataset, self.batch_size, shuffle=True, drop_last=False))
                 print('💊 开始训练...')
 
                 self.policy_value_net.train()
-                # 随机选出一批数据来训练，防止过拟合
-                feature_planes, pi, z = next(data_loader)
-                feature_planes = feature_planes.to(self.device)
-                pi, z = pi.to(self.device), z.to(self.device)
-                for _ in range(5):
+                # 随机选出一批数据来训练，防止过拟合，传输到设备上之后再转换为单精度，特征平面由网络解压
+                feature_planes, pi, z = self.dataset.sample(self.batch_size)
+                feature_planes = feature_planes.to(
+                    self.device, non_blocking=True)
+                pi = pi.to(self.device, non_blocking=True).float()
+                z = z.to(self.device, non_blocking=True).float()
+                n_steps, total_loss = 5, 0
+                for _ in range(n_steps):
                     # 前馈
                     p_hat, value = self.policy_value_net(feature_planes)
                     # 梯度清零
@@ -216,12 +218,18 @@ class TrainModel:
                     loss.backward()
                     # 更新参数
                     self.optimizer.step()
-                    # 学习率退火
-                    self.lr_scheduler.step()
+                    total_loss += loss.item()
+
+                # 学习率退火，每次训练只更新一次学习率
+                self.lr_scheduler.step()
+
+                # 权重已经更新，需要重新导出推理模型
+                self.policy_value_net.update_inference_net()
 
-                # 记录误差
-                self.train_losses.append([i, loss.item()])
-                print(f"🚩 train_loss = {loss.item():<10.5f}\n")
+                # 记录这次训练的平均误差
+                loss = total_loss/n_steps
+                self.train_losses.append([i, loss])
+                print(f"🚩 train_loss = {loss:<10.5f}\n")
 
             # 测试模型
             if (i+1) % self.check_frequency == 0:
@@ -242,7 +250,8 @@ class TrainModel:
         best_model = torch.load(model_path)  # type:PolicyValueNet
         best_model.eval()
         best_model.set_device(self.is_use_gpu)
-        mcts = AlphaZeroMCTS(best_model, self.c_puct, self.n_mcts_iters)
+        mcts = AlphaZeroMCTS(best_model, self.c_puct, self.n_mcts_iters,
+                             batch_size=self.mcts_batch_size)
         self.mcts.set_self_play(False)
         self.policy_value_net.eval()
 
@@ -255,12 +264,12 @@ class TrainModel:
             mcts.reset_root()
             while True:
                 # 当前模型走一步
-                is_over, winner = self.__do_mcts_action(self.mcts)
+                is_over, winner = self.__do_mcts_action(self.mcts, mcts)
                 if is_over:
                     n_wins += int(winner == ChessBoard.BLACK)
                     break
                 # 历史最优模型走一步
-                is_over, winner = self.__do_mcts_action(mcts)
+                is_over, winner = self.__do_mcts_action(mcts, self.mcts)
                 if is_over:
                     break
 
@@ -304,10 +313,11 @@ class TrainModel:
                 json.dump(self.games, f)
 
 
-    def __do_mcts_action(self, mcts):
-        """ 获取动作 """
+    def __do_mcts_action(self, mcts: AlphaZeroMCTS, opponent_mcts: AlphaZeroMCTS):
+        """ 获取动作并更新对手的根节点 """
         action = mcts.get_action(self.chess_board)
         self.chess_board.do_action(action)
+        opponent_mcts.advance_root(action)
         is_over, winner = self.chess_board.is_game_over()
         return is_over, winner
 
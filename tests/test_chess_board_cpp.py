@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import torch
+from alphazero import ChessBoard
+from alphazero.chess_board import PyChessBoard
+
+
+@unittest.skipIf(ChessBoard is PyChessBoard, '没有编译 C++ 实现的棋盘')
+class TestChessBoardCpp(unittest.TestCase):
+    """ 测试 C++ 实现的棋盘和 Python 实现的棋盘行为相同 """
+
+    def test_random_games(self):
+        """ 测试随机对局 """
+        random.seed(0)
+        for n_feature_planes in (2, 4, 6, 7):
+            cpp_board, py_board = ChessBoard(9, n_feature_planes), PyChessBoard(9, n_feature_planes)
+            for _ in range(20):
+                cpp_board.clear_board()
+                py_board.clear_board()
+                self.__assert_equal(cpp_board, py_board)
+
+                while not py_board.is_game_over()[0]:
+                    action = random.choice(py_board.available_actions)
+                    cpp_board.do_action(action)
+                    py_board.do_action(action)
+                    self.__assert_equal(cpp_board, py_board)
+
+    def test_copy(self):
+        """ 测试复制棋盘 """
+        board = ChessBoard()
+        board.do_action(40)
+        copy = board.copy()
+        copy.do_action(41)
+
+        self.assertIsInstance(copy, ChessBoard)
+        self.assertEqual(board.state, {40: ChessBoard.BLACK})
+        self.assertEqual(copy.state, {40: ChessBoard.BLACK, 41: ChessBoard.WHITE})
+        self.assertEqual(board.current_player, ChessBoard.WHITE)
+        self.assertNotEqual(board.hash, copy.hash)
+
+    def test_do_action_(self):
+        """ 测试 app 使用的落子函数 """
+        board = ChessBoard()
+        self.assertTrue(board.do_action_((4, 4)))
+        self.assertFalse(board.do_action_((4, 4)))
+        self.assertFalse(board.do_action_((9, 0)))
+        self.assertEqual(board.previous_action, 40)
+
+    def test_occupied_action(self):
+        """ 测试在已经有棋子的位置或者棋盘外落子 """
+        cpp_board, py_board = ChessBoard(), PyChessBoard()
+        for board in (cpp_board, py_board):
+            board.do_action(40)
+            for action in (40, -1, 81):
+                with self.assertRaises(ValueError):
+                    board.do_action(action)
+
+        self.__assert_equal(cpp_board, py_board)
+
+    def __assert_equal(self, cpp_board, py_board):
+        """ 比较两个棋盘的状态 """
+        self.assertEqual(cpp_board.state, py_board.state)
+        self.assertEqual(cpp_board.hash, py_board.hash)
+        self.assertEqual(cpp_board.history_hash, py_board.history_hash)
+        self.assertEqual(cpp_board.current_player, py_board.current_player)
+        self.assertEqual(cpp_board.previous_action, py_board.previous_action)
+        self.assertEqual(cpp_board.available_mask, py_board.available_mask)
+        self.assertEqual(cpp_board.available_actions, py_board.available_actions)
+        self.assertEqual(cpp_board.is_game_over(), py_board.is_game_over())
+        self.assertTrue(torch.equal(cpp_board.get_feature_planes(), py_board.get_feature_planes()))
@@ -0,0 +1,45 @@
+import random
+import unittest
+
+import numpy as np
+import torch
+from alphazero import ChessBoard, PolicyValueNet
+
+
+class TestFeaturePlanes(unittest.TestCase):
+    """ 测试按位压缩的特征平面解压之后和训练已有模型时使用的特征平面相同 """
+
+    def test_random_games(self):
+        """ 测试随机对局 """
+        random.seed(0)
+        for n_feature_planes in (4, 6, 7):
+            net = PolicyValueNet(9, n_feature_planes, is_use_gpu=False)
+            for _ in range(10):
+                chess_board = ChessBoard(9, n_feature_planes)
+                while True:
+                    feature_planes = net.unpack_feature_planes(
+                        chess_board.get_feature_planes()[None])[0]
+                    self.assertTrue(torch.equal(
+                        feature_planes, self.__reference_planes(chess_board)))
+
+                    if chess_board.is_game_over()[0]:
+                        break
+                    chess_board.do_action(random.choice(chess_board.available_actions))
+
+    def __reference_planes(self, chess_board: ChessBoard):
+        """ 按照压缩之前的方式构造特征平面 """
+        n = chess_board.board_len
+        n_feature_planes = chess_board.n_feature_planes
+        feature_planes = torch.zeros((n_feature_planes, n**2))
+        if chess_board.state:
+            actions = np.array(list(chess_board.state.keys()))[::-1]
+            players = np.array(list(chess_board.state.values()))[::-1]
+            Xt = actions[players == chess_board.current_player]
+            Yt = actions[players != chess_board.current_player]
+            for i in range((n_feature_planes-1)//2):
+                if i < len(Xt):
+                    feature_planes[2*i, Xt[i:]] = 1
+                if i < len(Yt):
+                    feature_planes[2*i+1, Yt[i:]] = 1
+
+        return feature_planes.view(n_feature_planes, n, n)
@@ -1,4 +1,7 @@
+import random
 import unittest
+
+import numpy as np
 from alphazero import ChessBoard
 
 
@@ -69,6 +72,56 @@ class TestGameOver(unittest.TestCase):
         self.__simulation(multi_game_actions, [
                           (True, ChessBoard.BLACK), (True, ChessBoard.WHITE), (False, None)])
 
+    def test_random_games(self):
+        """ 和逐个棋子扫描整个棋盘的结果进行比较 """
+        random.seed(0)
+        for _ in range(200):
+            chess_board = ChessBoard()
+            while True:
+                chess_board.do_action(random.choice(chess_board.available_actions))
+                is_over, winner = chess_board.is_game_over()
+                self.assertEqual(winner, self.__scan_winner(chess_board))
+                if is_over:
+                    break
+
+    def test_occupied_action(self):
+        """ 测试在已经有棋子的位置落子 """
+        chess_board = ChessBoard()
+        chess_board.do_action(40)
+        board_hash = chess_board.hash
+        with self.assertRaises(ValueError):
+            chess_board.do_action(40)
+
+        # 落子失败时棋盘不变
+        self.assertEqual(chess_board.state, {40: ChessBoard.BLACK})
+        self.assertEqual(chess_board.hash, board_hash)
+        self.assertEqual(chess_board.current_player, ChessBoard.WHITE)
+        self.assertEqual(len(chess_board.available_actions), 80)
+
+    def test_numpy_action(self):
+        """ 测试使用 numpy 整数落子 """
+        chess_board = ChessBoard()
+        chess_board.do_action(np.int64(40))
+        self.assertEqual(chess_board.state, {40: ChessBoard.BLACK})
+        with self.assertRaises(ValueError):
+            chess_board.do_action(np.int64(40))
+
+    def __scan_winner(self, chess_board: ChessBoard):
+        """ 扫描整个棋盘，返回连成五子的玩家 """
+        n = chess_board.board_len
+        for action, player in chess_board.state.items():
+            row, col = action//n, action % n
+            for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                if not (0 <= row+4*dr < n and 0 <= col+4*dc < n):
+                    continue
+                for k in range(1, 5):
+                    if chess_board.state.get((row+k*dr)*n+col+k*dc) != player:
+                        break
+                else:
+                    return player
+
+        return None
+
     def __simulation(self, multi_game_actions, labels):
         """ 测试结果 """
 
@@ -0,0 +1,155 @@
+import unittest
+from unittest.mock import patch
+
+import torch
+from alphazero import AlphaZeroMCTS, ChessBoard, PolicyValueNet
+from alphazero.self_play import self_play
+
+
+class TestMCTS(unittest.TestCase):
+    """ 测试蒙特卡洛树搜索 """
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.net = PolicyValueNet(9, 6, is_use_gpu=False)
+        self.n_planes = 0
+        self.n_evaluated = 0
+        self.n_outstanding = 0
+        self.max_outstanding = 0
+
+        # 统计送入策略价值网络的局面个数和同时等待结果的批次个数
+        predict_batch_async = self.net.predict_batch_async
+
+        def counted_predict(chess_boards):
+            self.n_evaluated += len(chess_boards)
+            self.n_outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.n_outstanding)
+            get_results = predict_batch_async(chess_boards)
+
+            def counted_results():
+                self.n_outstanding -= 1
+                return get_results()
+
+            return counted_results
+
+        self.net.predict_batch_async = counted_predict
+
+    def test_get_action(self):
+        """ 测试搜索时只为送入网络的叶节点构造特征平面 """
+        mcts = AlphaZeroMCTS(self.net, n_iters=100, batch_size=8)
+        chess_board = ChessBoard(9, 6)
+        with self.__count_planes():
+            for _ in range(3):
+                action = mcts.get_action(chess_board)
+                chess_board.do_action(action)
+
+        self.assertGreater(self.n_planes, 0)
+        self.assertEqual(self.n_planes, self.n_evaluated)
+        self.assertLessEqual(self.n_planes, 3*mcts.n_iters)
+
+    def test_sync_evaluation(self):
+        """ 测试同步前馈时每批叶节点评估完就立即拓展 """
+        mcts = AlphaZeroMCTS(self.net, n_iters=50, batch_size=1)
+        mcts.get_action(ChessBoard(9, 6))
+        self.assertEqual(self.max_outstanding, 1)
+        self.assertEqual(self.n_outstanding, 0)
+
+    def test_self_play(self):
+        """ 测试自我博弈时只额外为实际下的每一步构造一次特征平面 """
+        mcts = AlphaZeroMCTS(self.net, n_iters=20, is_self_play=True)
+        with self.__count_planes():
+            self_play_data, action_list = self_play(mcts, ChessBoard(9, 6))
+
+        self.assertEqual(len(self_play_data.feature_planes_list), len(action_list))
+        self.assertEqual(self.n_planes, self.n_evaluated + len(action_list))
+
+    def test_reuse_root(self):
+        """ 测试对手落子之后复用子树 """
+        mcts = AlphaZeroMCTS(self.net, n_iters=200)
+        chess_board = ChessBoard(9, 6)
+        chess_board.do_action(mcts.get_action(chess_board))
+
+        # 对手落子之后没有调用 advance_root，搜索时根据 previous_action 自动更新根节点
+        action, node = max(mcts.root.children.items(), key=lambda i: i[1].N)
+        N, children = node.N, dict(node.children)
+        self.assertGreater(N, 0)
+        self.assertTrue(children)
+        chess_board.do_action(action)
+        self.__sync_root(mcts, chess_board)
+
+        self.assertIs(mcts.root, node)
+        self.assertIsNone(node.parent)
+        self.assertEqual(node.N, N)
+        self.assertEqual(node.children, children)
+
+        mcts.get_action(chess_board)
+        self.assertEqual(node.N, N + mcts.n_iters)
+
+    def test_reset_root(self):
+        """ 测试清空棋盘或者一次下了两步之后重置根节点 """
+        mcts = AlphaZeroMCTS(self.net, n_iters=50)
+        chess_board = ChessBoard(9, 6)
+        chess_board.do_action(mcts.get_action(chess_board))
+
+        chess_board.clear_board()
+        self.__sync_root(mcts, chess_board)
+        self.__assert_new_root(mcts.root)
+
+        chess_board.do_action(mcts.get_action(chess_board))
+        for action in chess_board.available_actions[:2]:
+            chess_board.do_action(action)
+        self.__sync_root(mcts, chess_board)
+        self.__assert_new_root(mcts.root)
+
+        # 重置之后根节点对应当前局面，再次同步时不会重置
+        root = mcts.root
+        self.__sync_root(mcts, chess_board)
+        self.assertIs(mcts.root, root)
+
+    def test_advance_unexpanded_root(self):
+        """ 测试在没有拓展的节点上更新根节点 """
+        # 还没有搜索过时根节点没有子节点
+        mcts = AlphaZeroMCTS(self.net, n_iters=50)
+        mcts.advance_root(40)
+        self.__assert_new_root(mcts.root)
+
+        chess_board = ChessBoard(9, 6)
+        chess_board.do_action(40)
+        chess_board.do_action(mcts.get_action(chess_board))
+
+        # 先移动到没有访问过的叶节点，再执行叶节点没有拓展的动作
+        actions = [a for a, node in mcts.root.children.items() if node.is_leaf_node()]
+        mcts.advance_root(actions[0])
+        action = next(a for a in chess_board.available_actions if a != actions[0])
+        self.assertNotIn(action, mcts.root.children)
+        mcts.advance_root(action)
+        self.__assert_new_root(mcts.root)
+
+        # 根节点对应的棋盘也被更新，所以对手按相同的顺序落子之后不会重置根节点
+        root = mcts.root
+        chess_board.do_action(actions[0])
+        chess_board.do_action(action)
+        self.__sync_root(mcts, chess_board)
+        self.assertIs(mcts.root, root)
+        mcts.get_action(chess_board)
+        self.assertEqual(root.N, mcts.n_iters)
+
+    def __sync_root(self, mcts: AlphaZeroMCTS, chess_board: ChessBoard):
+        """ 让根节点和棋盘同步 """
+        mcts._AlphaZeroMCTS__sync_root(chess_board)
+
+    def __assert_new_root(self, root):
+        """ 检查根节点是新建的节点 """
+        self.assertIsNone(root.parent)
+        self.assertEqual(root.N, 0)
+        self.assertFalse(root.children)
+
+    def __count_planes(self):
+        """ 统计 `ChessBoard.get_feature_planes` 的调用次数 """
+        get_feature_planes = ChessBoard.get_feature_planes
+
+        def counted_planes(chess_board):
+            self.n_planes += 1
+            return get_feature_planes(chess_board)
+
+        return patch.object(ChessBoard, 'get_feature_planes', counted_planes)
@@ -0,0 +1,41 @@
+import threading
+import unittest
+
+import torch
+from alphazero import AlphaZeroMCTS, ChessBoard, PolicyValueNet
+from alphazero.self_play import SelfPlayWorkers
+
+
+class TestSelfPlayWorkers(unittest.TestCase):
+    """ 测试多进程自我博弈 """
+
+    def test_update_inference_net(self):
+        """ 测试推理服务器前馈时主线程更新推理模型 """
+        torch.manual_seed(0)
+        net = PolicyValueNet(9, 6, is_use_gpu=False)
+        mcts = AlphaZeroMCTS(net, n_iters=20)
+
+        # 记录推理服务器线程中的异常
+        errors = []
+        excepthook = threading.excepthook
+        threading.excepthook = lambda args: errors.append(args.exc_value)
+
+        workers = SelfPlayWorkers(net, 2, n_mcts_iters=10, mcts_batch_size=4)
+        try:
+            for _ in range(3):
+                # 推理服务器前馈的同时，主线程更新权重、导出推理模型并使用推理模型搜索
+                with torch.no_grad():
+                    for param in net.parameters():
+                        param.add_(0.01)
+
+                net.update_inference_net()
+                mcts.get_action(ChessBoard(9, 6))
+                self_play_data, action_list = workers.get()
+                self.assertEqual(len(self_play_data.pi_list), len(action_list))
+
+            self.assertTrue(workers.server.is_alive())
+        finally:
+            workers.close()
+            threading.excepthook = excepthook
+
+        self.assertEqual(errors, [])
@@ -0,0 +1,64 @@
+import unittest
+
+import torch
+from alphazero import ChessBoard
+
+
+class TestZobristHash(unittest.TestCase):
+    """ 测试棋盘的 Zobrist 哈希值 """
+
+    def test_transposition(self):
+        """ 测试不同落子顺序得到的相同局面 """
+        boards = [self.__play(actions) for actions in [
+            [(0, 0), (1, 1), (0, 1), (1, 2)],
+            [(0, 1), (1, 2), (0, 0), (1, 1)],
+        ]]
+        self.assertEqual(boards[0].hash, boards[1].hash)
+
+    def test_different_position(self):
+        """ 测试交换黑白棋子后的局面 """
+        boards = [self.__play(actions) for actions in [
+            [(0, 0), (1, 1), (0, 1), (1, 2)],
+            [(1, 1), (0, 0), (1, 2), (0, 1)],
+        ]]
+        self.assertNotEqual(boards[0].hash, boards[1].hash)
+
+    def test_copy_and_clear(self):
+        """ 测试复制和清空棋盘 """
+        board = self.__play([(4, 4), (3, 3)])
+        copy = board.copy()
+        self.assertEqual(copy.hash, board.hash)
+
+        copy.do_action(0)
+        self.assertNotEqual(copy.hash, board.hash)
+
+        board.clear_board()
+        self.assertEqual(board.hash, ChessBoard().hash)
+
+    def test_history_hash(self):
+        """ 测试包含最近落点的哈希值 """
+        # 最近的落点不同，特征平面不同
+        boards = [self.__play(actions) for actions in [
+            [(0, 0), (1, 1), (0, 1), (1, 2)],
+            [(0, 1), (1, 2), (0, 0), (1, 1)],
+        ]]
+        self.assertEqual(boards[0].hash, boards[1].hash)
+        self.assertNotEqual(boards[0].history_hash, boards[1].history_hash)
+        self.assertFalse(torch.equal(
+            boards[0].get_feature_planes(), boards[1].get_feature_planes()))
+
+        # 只有更早的落子顺序不同，特征平面相同
+        boards = [self.__play(actions, 6) for actions in [
+            [(0, 0), (1, 1), (0, 1), (1, 2), (2, 2), (3, 3)],
+            [(0, 1), (1, 2), (0, 0), (1, 1), (2, 2), (3, 3)],
+        ]]
+        self.assertEqual(boards[0].history_hash, boards[1].history_hash)
+        self.assertTrue(torch.equal(
+            boards[0].get_feature_planes(), boards[1].get_feature_planes()))
+
+    def __play(self, actions, n_feature_planes=7):
+        """ 在新棋盘上依次落子 """
+        chess_board = ChessBoard(n_feature_planes=n_feature_planes)
+        for i, j in actions:
+            chess_board.do_action(i*9+j)
+        return chess_board
@@ -14,7 +14,12 @@ train_config = {
     'is_save_game': False,
     'n_feature_planes': 6,
     'check_frequency': 100,
-    'start_train_size': 500
+    'mcts_batch_size': 8,
+    'start_train_size': 500,
+    'n_self_play_workers': 4
 }
-train_model = TrainModel(**train_config)
-train_model.train()
+
+# 自我博弈进程会重新导入这个模块，所以需要保护入口
+if __name__ == '__main__':
+    train_model = TrainModel(**train_config)
+    train_model.train()
@@ -0,0 +1,31 @@
+# coding: utf-8
+""" 编译 C++ 实现的棋盘，编译之后 `alphazero.ChessBoard` 会自动使用 C++ 实现
+
+在项目根目录下运行 `python utils/build_chess_board.py`，需要 g++ 或者 clang++，
+如果没有安装 pybind11，就使用 PyTorch 自带的 pybind11 头文件
+"""
+import subprocess
+import sys
+import sysconfig
+from pathlib import Path
+
+try:
+    import pybind11
+    include_dirs = [pybind11.get_include()]
+except ImportError:
+    from torch.utils.cpp_extension import include_paths
+    include_dirs = include_paths()
+
+root = Path(__file__).resolve().parent.parent / 'alphazero'
+source = root / 'csrc' / 'chess_board.cpp'
+target = root / ('_chess_board_cpp' + sysconfig.get_config_var('EXT_SUFFIX'))
+
+include_dirs.append(sysconfig.get_paths()['include'])
+command = ['c++', '-O3', '-Wall', '-shared', '-std=c++17', '-fPIC', '-fvisibility=hidden']
+command += ['-I' + i for i in include_dirs]
+if sys.platform == 'darwin':
+    command += ['-undefined', 'dynamic_lookup']
+
+command += [str(source), '-o', str(target)]
+print(' '.join(command))
+subprocess.run(command, check=True)